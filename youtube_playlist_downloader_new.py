@@ -10,9 +10,16 @@ import os
 import sys
 import re
 import json
+import shutil
+import queue
 import logging
+import logging.handlers
+import threading
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 
 # 抑制所有警告
@@ -21,13 +28,94 @@ os.environ['PYTHONWARNINGS'] = 'ignore'
 import yt_dlp
 from urllib.parse import urlparse, parse_qs
 
+# orjson 為選用套件，未安裝時使用標準 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 預先編譯的正規表示式
+_ILLEGAL_CHARS_RE = re.compile(r'[<>:"/\\|?*]')
+_WS_RE = re.compile(r'\s+')
+_INDEX_PREFIX_RE = re.compile(r'(\d{2,}) - ')
+_NONWORD_RE = re.compile(r'[\W_]+')
+
+def _json_dumps(obj):
+    """序列化為 JSON 字串（保留非 ASCII 字元）"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+def _json_loads(data):
+    """解析 JSON 字串"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# 檔名清理使用單次字元掃描；設為 False 時改用原本的正規表示式版本（比對測試用）
+SANITIZE_SINGLE_PASS = True
+
+_ILLEGAL_CHARS = frozenset('<>:"/\\|?*')
+
+@lru_cache(maxsize=4096)
+def _sanitize_filename_regex(filename):
+    """清理檔名（正規表示式版本）"""
+    # 移除或替換不合法字元
+    filename = _ILLEGAL_CHARS_RE.sub('_', filename)
+    # 移除多餘空格
+    filename = _WS_RE.sub(' ', filename).strip()
+    
+    # 限制檔名長度
+    if len(filename) > 200:
+        filename = filename[:200] + '...'
+    
+    return filename
+
+@lru_cache(maxsize=4096)
+def _sanitize_filename_single_pass(filename):
+    """清理檔名（單次字元掃描版本）"""
+    # 一次掃描完成：替換不合法字元、合併連續空白並去除前後空白
+    out = []
+    prev_space = True  # 視開頭為空白，藉此略過前導空白
+    for ch in filename:
+        if ch in _ILLEGAL_CHARS:
+            ch = '_'
+        elif ch.isspace():
+            if prev_space:
+                continue
+            prev_space = True
+            out.append(' ')
+            continue
+        prev_space = False
+        out.append(ch)
+    if out and out[-1] == ' ':
+        out.pop()
+    filename = ''.join(out)
+    
+    # 限制檔名長度
+    if len(filename) > 200:
+        filename = filename[:200] + '...'
+    
+    return filename
+
+def _sanitize_filename_cached(filename):
+    """清理檔名（兩種實作各自快取結果，切換旗標後立即生效）"""
+    if SANITIZE_SINGLE_PASS:
+        return _sanitize_filename_single_pass(filename)
+    return _sanitize_filename_regex(filename)
+
 class YouTubePlaylistDownloader:
-    def __init__(self, output_dir=None):
+    def __init__(self, output_dir=None, concurrency=None, ffmpeg_threads=2, cache_ttl=3600,
+                 write_metadata=False):
         """
         初始化下載器
         
         Args:
             output_dir (str): 輸出資料夾路徑，預設為 audio/歌/播放清單
+            concurrency (int): 同時下載的影片數量，預設為 CPU 核心數 / ffmpeg_threads
+            ffmpeg_threads (int): 每個 FFmpeg 轉換程序使用的線程數
+            cache_ttl (int): 播放清單資訊快取的有效秒數
+            write_metadata (bool): 是否寫入影片標籤（需要額外執行一次 FFmpeg）
         """
         if output_dir is None:
             self.output_dir = Path(__file__).parent / "audio" / "歌" / "播放清單"
@@ -36,22 +124,47 @@ class YouTubePlaylistDownloader:
           # 確保輸出資料夾存在
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
+        # 播放清單資訊快取
+        self.cache_dir = self.output_dir / ".cache"
+        self.cache_ttl = cache_ttl
+        
         # 設定日誌
         self.setup_logging()
         
-        # 追蹤失敗的影片
-        self.failed_downloads = []
-        self.current_video_info = None
+        # 追蹤下載進度（失敗記錄逐筆寫入 logs/failed_downloads_*.jsonl）
         self.download_count = 0
         self.total_count = 0
         
-        # 追蹤音頻格式嘗試
-        self.current_format = 'wav'
-        self.format_attempts = []
+        # 並行下載設定（yt-dlp 的 progress_hook 會在工作執行緒中觸發）
+        # 每個 FFmpeg 只使用少量線程，讓多個檔案同時轉換以填滿所有核心
+        self.ffmpeg_threads = max(1, int(ffmpeg_threads))
+        if concurrency is None:
+            concurrency = (os.cpu_count() or 1) // self.ffmpeg_threads
+        self.concurrency = max(1, int(concurrency))
+        self._lock = threading.Lock()
+        
+        # 進度輸出節流：各影片最新進度 {影片索引: (百分比, 速度, ETA)}
+        self._progress = {}
+        self._last_print_ts = 0.0
+        self._last_line_len = 0
+        
+        # 每個工作執行緒重複使用自己的 YoutubeDL 實例（保留連線池與 extractor）
+        # 目前嘗試的音頻格式也記錄在各工作執行緒的 self._ydl_local.current_format
+        self._ydl_local = threading.local()
+        self._ydl_instances = []
+        
+        # 播放清單資料夾的檔案索引快照 {影片索引: [(檔案路徑, 檔名), ...]}，依格式優先順序排列，None 表示尚未掃描
+        self._dir_index = None
+        self.playlist_dir = None
+        # 檔名使用播放清單中的絕對索引，顯示進度時扣除起始偏移
+        self._index_offset = 0
+        
+        # 是否寫入音頻標籤（FFmpegMetadata）
+        self.write_metadata = write_metadata
         
         # 設定 yt-dlp 選項 - 優先 WAV，失敗時回退到 MP3
         self.ydl_opts = {
-            'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',  # 下載最佳音質
+            'format': 'bestaudio[acodec=opus]/bestaudio[ext=m4a]/bestaudio/best',  # 優先純音頻 DASH 串流
             'outtmpl': str(self.output_dir / '%(playlist_index)02d - %(title)s.%(ext)s'),
             'extractaudio': True,
             'audioformat': 'wav',  # 優先使用 WAV 格式 (無損)
@@ -64,10 +177,10 @@ class YouTubePlaylistDownloader:
             'writethumbnail': False,  # 不下載縮圖
             'writesubtitles': False,  # 不下載字幕
             'writeautomaticsub': False,  # 不下載自動字幕
+            'concurrent_fragment_downloads': 8,  # DASH/HLS 分段並行下載
             'extractor_args': {
                 'youtube': {
                     'player_client': ['android'],  # 只使用 android 客戶端減少警告
-                    'skip': ['dash', 'hls']
                 }
             },
             'postprocessors': [
@@ -76,16 +189,32 @@ class YouTubePlaylistDownloader:
                     'preferredcodec': 'wav',
                     'preferredquality': '0',  # WAV 無損品質
                 },
-                {
-                    'key': 'FFmpegMetadata',
-                    'add_metadata': True,
-                },
-            ],            'postprocessor_args': {
-                'ffmpeg': ['-threads', '0']  # 使用所有可用 CPU 線程
+            ],
+            'postprocessor_args': {
+                'ffmpeg': ['-threads', str(self.ffmpeg_threads), '-preset', 'fast']  # 每個轉換程序使用固定線程數
             },
             'logger': self.get_logger(),
             'progress_hooks': [self.progress_hook],
         }
+        
+        # 寫入標籤需要額外啟動一次 FFmpeg，只在需要時加入
+        if self.write_metadata:
+            self.ydl_opts['postprocessors'].append({
+                'key': 'FFmpegMetadata',
+                'add_metadata': True,
+            })
+        
+        # 有安裝 aria2c 時改用多連線下載，否則使用 yt-dlp 內建下載器
+        if shutil.which('aria2c'):
+            self.ydl_opts['external_downloader'] = 'aria2c'
+            self.ydl_opts['external_downloader_args'] = {
+                'aria2c': ['-x', '16', '-k', '1M', '-s', '16', '--file-allocation=none', '--console-log-level=error']
+            }
+            self.logger.info("偵測到 aria2c，使用多連線下載")
+        
+        # WAV / MP3 兩組選項只建立一次，之後每個 YoutubeDL 實例只覆寫 outtmpl
+        self._wav_opts = dict(self.ydl_opts)
+        self._mp3_opts = self.create_mp3_options()
     
     def setup_logging(self):
         """設定日誌系統"""
@@ -95,16 +224,30 @@ class YouTubePlaylistDownloader:
         # 創建日誌檔案名稱（包含時間戳）
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         log_file = log_dir / f"download_log_{timestamp}.log"
+        # 檔案寫入交由背景執行緒處理，避免磁碟 I/O 阻塞下載執行緒
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        log_queue = queue.Queue(-1)
+        queue_handler = logging.handlers.QueueHandler(log_queue)
         # 設定日誌格式
         logging.basicConfig(
             level=logging.INFO,
             format='%(asctime)s - %(levelname)s - %(message)s',
             handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
+                queue_handler,
                 logging.StreamHandler(sys.stdout)
             ],
             force=True
         )
+        self._log_listener = logging.handlers.QueueListener(
+            log_queue, file_handler, respect_handler_level=True
+        )
+        self._log_listener.start()
+        
+        # 失敗與格式嘗試記錄以 JSONL 逐筆附加，使用緩衝寫入
+        self._failed_path = log_dir / f"failed_downloads_{timestamp}.jsonl"
+        self._attempts_path = log_dir / f"format_attempts_{timestamp}.jsonl"
+        self._failed_f = open(self._failed_path, 'a', buffering=65536, encoding='utf-8')
+        self._attempts_f = open(self._attempts_path, 'a', buffering=65536, encoding='utf-8')
         
         self.logger = logging.getLogger(__name__)
         # 抑制所有可能的 yt-dlp 相關警告訊息
@@ -120,36 +263,114 @@ class YouTubePlaylistDownloader:
         self.logger.info("YouTube 播放清單音頻下載器啟動")
         self.logger.info("=" * 50)
     
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        """釋放 YoutubeDL 連線，停止背景日誌執行緒並寫出所有尚未寫入的日誌"""
+        instances = getattr(self, '_ydl_instances', [])
+        self._ydl_instances = []
+        for ydl in instances:
+            try:
+                ydl.close()
+            except Exception:
+                pass
+        
+        listener = getattr(self, '_log_listener', None)
+        if listener is not None:
+            self._log_listener = None
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+        
+        # 關閉記錄檔，沒有任何記錄的空檔案直接刪除
+        for attr, path_attr in (('_failed_f', '_failed_path'), ('_attempts_f', '_attempts_path')):
+            f = getattr(self, attr, None)
+            if f is None or f.closed:
+                continue
+            empty = f.tell() == 0
+            f.close()
+            if empty:
+                try:
+                    getattr(self, path_attr).unlink()
+                except OSError:
+                    pass
+    
+    def __del__(self):
+        self.close()
+    
     def get_logger(self):
         """返回 yt-dlp 使用的日誌記錄器"""
         return self.logger
     
     def progress_hook(self, d):
-        """進度回調函數"""
+        """進度回調函數（可能由多個工作執行緒同時呼叫，輸出限制為每秒約 4 次）"""
+        filename = d.get('filename') or '未知檔案'
+        match = _INDEX_PREFIX_RE.match(os.path.basename(filename))
+        index = int(match.group(1)) if match else self.download_count
+        
         if d['status'] == 'downloading':
-            if 'total_bytes' in d:
-                percent = d['downloaded_bytes'] / d['total_bytes'] * 100
-                speed = d.get('speed', 0)
-                if speed:
-                    speed_mb = speed / (1024 * 1024)
-                    eta = d.get('eta', 0)
-                    progress_info = f"[{self.download_count}/{self.total_count}] {percent:.1f}% | {speed_mb:.1f} MB/s | ETA: {eta}s"
-                else:
-                    progress_info = f"[{self.download_count}/{self.total_count}] {percent:.1f}%"
-                print(f"\r🔄 下載中 {progress_info}", end='', flush=True)
-            else:
-                print(f"\r🔄 [{self.download_count}/{self.total_count}] 下載中...", end='', flush=True)
+            total = d.get('total_bytes')
+            percent = d['downloaded_bytes'] / total * 100 if total else None
+            with self._lock:
+                self._progress[index] = (percent, d.get('speed') or 0, d.get('eta'))
+                now = time.monotonic()
+                if now - self._last_print_ts < 0.25:
+                    return
+                self._last_print_ts = now
+                line = self.format_progress()
+                # 以空白覆蓋上一次較長的輸出，整行一次寫入
+                padding = ' ' * max(0, self._last_line_len - len(line))
+                self._last_line_len = len(line)
+                sys.stdout.write(f"\r{line}{padding}")
+                sys.stdout.flush()
         elif d['status'] == 'finished':
-            filename = os.path.basename(d['filename'])
-            print(f"\n✅ 下載完成: {filename}")
-            print(f"🔄 轉換為 {self.current_format.upper()} 格式中...")
+            filename = os.path.basename(filename)
+            with self._lock:
+                self._progress.pop(index, None)
+                self._last_line_len = 0
+                print(f"\n✅ 下載完成: {filename}")
+                # progress_hook 在下載該影片的工作執行緒中呼叫，因此讀取執行緒自己的格式
+                current_format = getattr(self._ydl_local, 'current_format', 'wav')
+                print(f"🔄 轉換為 {current_format.upper()} 格式中...")
             self.logger.info(f"下載完成，開始轉換: {filename}")
         elif d['status'] == 'error':
-            filename = d.get('filename', '未知檔案')
-            print(f"\n❌ 失敗: {os.path.basename(filename)}")
+            with self._lock:
+                self._progress.pop(index, None)
+                self._last_line_len = 0
+                print(f"\n❌ 失敗: {os.path.basename(filename)}")
             error_msg = f"下載失敗: {filename} - {d.get('error', '未知錯誤')}"
             self.logger.error(error_msg)
     
+    def format_progress(self):
+        """
+        組合目前所有下載中影片的進度為單行文字（呼叫端需持有鎖）
+        
+        Returns:
+            str: 進度文字
+        """
+        if len(self._progress) == 1:
+            (index, (percent, speed, eta)), = self._progress.items()
+            index -= self._index_offset
+            if percent is None:
+                return f"🔄 [{index}/{self.total_count}] 下載中..."
+            progress_info = f"[{index}/{self.total_count}] {percent:.1f}%"
+            if speed:
+                progress_info += f" | {speed / (1024 * 1024):.1f} MB/s | ETA: {eta}s"
+            return f"🔄 下載中 {progress_info}"
+        
+        # 並行下載時，每個影片只顯示索引與百分比，並合計總速度
+        parts = []
+        total_speed = 0
+        for index, (percent, speed, eta) in sorted(self._progress.items()):
+            position = index - self._index_offset
+            parts.append(f"[{position}] {percent:.0f}%" if percent is not None else f"[{position}] ...")
+            total_speed += speed
+        return f"🔄 下載中 {' '.join(parts)} | {total_speed / (1024 * 1024):.1f} MB/s"
+    
     def extract_playlist_id(self, url):
         """
         從 YouTube URL 中提取播放清單 ID
@@ -181,21 +402,11 @@ class YouTubePlaylistDownloader:
         Returns:
             str: 清理後的檔名
         """
-        # 移除或替換不合法字元
-        illegal_chars = r'[<>:"/\\|?*]'
-        filename = re.sub(illegal_chars, '_', filename)
-          # 移除多餘空格
-        filename = re.sub(r'\s+', ' ', filename).strip()
-        
-        # 限制檔名長度
-        if len(filename) > 200:
-            filename = filename[:200] + '...'
-        
-        return filename
+        return _sanitize_filename_cached(filename)
     
     def get_playlist_info(self, url):
         """
-        獲取播放清單資訊
+        獲取播放清單資訊（只列舉項目，不解析每個影片的完整資訊）
         
         Args:
             url (str): YouTube 播放清單 URL
@@ -203,6 +414,12 @@ class YouTubePlaylistDownloader:
         Returns:
             dict: 播放清單資訊
         """
+        playlist_id = self.extract_playlist_id(url)
+        cached = self.load_playlist_cache(playlist_id)
+        if cached:
+            self.logger.info(f"使用快取的播放清單資訊: {cached['title']} ({cached['entry_count']} 個影片)")
+            return cached
+        
         try:
             self.logger.info(f"正在分析播放清單: {url}")
             
@@ -210,25 +427,26 @@ class YouTubePlaylistDownloader:
             quiet_opts = {
                 'quiet': True,
                 'no_warnings': True,
-                'extract_flat': False,
+                'extract_flat': 'in_playlist',  # 只取得 id/url/title，下載時才解析影片
                 'extractor_args': {
                     'youtube': {
                         'player_client': ['android'],  # 只使用 android 客戶端
-                        'skip': ['dash', 'hls']
                     }
                 }
             }
             
             with yt_dlp.YoutubeDL(quiet_opts) as ydl:
                 info = ydl.extract_info(url, download=False)
+                entries = list(info.get('entries') or [])
                 playlist_info = {
                     'title': info.get('title', '未知播放清單'),
                     'uploader': info.get('uploader', '未知上傳者'),
                     'description': info.get('description', ''),
-                    'entry_count': len(info.get('entries', [])),
-                    'entries': info.get('entries', [])
+                    'entry_count': len(entries),
+                    'entries': entries
                 }
                 self.logger.info(f"播放清單分析完成: {playlist_info['title']} ({playlist_info['entry_count']} 個影片)")
+                self.save_playlist_cache(playlist_id, playlist_info)
                 return playlist_info
         except Exception as e:
             error_msg = f"獲取播放清單資訊時發生錯誤: {e}"
@@ -236,6 +454,127 @@ class YouTubePlaylistDownloader:
             print(error_msg)
             return None
     
+    def load_playlist_cache(self, playlist_id):
+        """
+        讀取播放清單資訊快取
+        
+        Args:
+            playlist_id (str): 播放清單 ID
+            
+        Returns:
+            dict: 快取的播放清單資訊，不存在或已過期則返回 None
+        """
+        if not playlist_id:
+            return None
+        
+        cache_file = self.cache_dir / f"{playlist_id}.json"
+        try:
+            if time.time() - cache_file.stat().st_mtime > self.cache_ttl:
+                return None
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                return _json_loads(f.read())
+        except (OSError, ValueError):
+            return None
+    
+    def save_playlist_cache(self, playlist_id, playlist_info):
+        """
+        保存播放清單資訊快取
+        
+        Args:
+            playlist_id (str): 播放清單 ID
+            playlist_info (dict): 播放清單資訊
+        """
+        if not playlist_id:
+            return
+        
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            cache_file = self.cache_dir / f"{playlist_id}.json"
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                f.write(_json_dumps(playlist_info))
+        except (OSError, TypeError, ValueError) as e:
+            self.logger.warning(f"無法保存播放清單快取: {e}")
+    
+    def load_manifest(self, playlist_id, start_index, end_index):
+        """
+        讀取上次下載的清單檔，並確認所有檔案仍然存在
+        
+        Args:
+            playlist_id (str): 播放清單 ID
+            start_index (int): 開始下載的影片索引
+            end_index (int): 結束下載的影片索引（可選）
+            
+        Returns:
+            dict: 可直接沿用的清單內容，無法沿用則返回 None
+        """
+        if not playlist_id:
+            return None
+        
+        manifest_file = self.cache_dir / f"{playlist_id}.manifest.json"
+        try:
+            # 播放清單可能新增影片或重新排序（指定範圍時亦然），只在快取有效期內沿用
+            if time.time() - manifest_file.stat().st_mtime > self.cache_ttl:
+                return None
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                manifest = _json_loads(f.read())
+        except (OSError, ValueError):
+            return None
+        
+        if manifest.get('start_index') != start_index or manifest.get('end_index') != end_index:
+            return None
+        entries = manifest.get('entries') or []
+        if not entries:
+            return None
+        
+        # 一次掃描資料夾，確認每個檔案都還在
+        dir_index = self.build_dir_index(Path(manifest['playlist_dir']))
+        names = {name for files in dir_index.values() for _, name in files}
+        if all(entry.get('file') in names for entry in entries):
+            return manifest
+        return None
+    
+    def save_manifest(self, playlist_id, playlist_info, playlist_dir, start_index, end_index, results):
+        """
+        保存本次下載的清單檔
+        
+        Args:
+            playlist_id (str): 播放清單 ID
+            playlist_info (dict): 播放清單資訊
+            playlist_dir (Path): 播放清單目錄
+            start_index (int): 開始下載的影片索引
+            end_index (int): 結束下載的影片索引（可選）
+            results (list): 每個影片的下載結果
+        """
+        if not playlist_id:
+            return
+        
+        dir_index = self.build_dir_index(playlist_dir)
+        entries = []
+        for result in sorted(results, key=lambda r: r['index']):
+            indexed = self.match_indexed_file(dir_index, result['index'], result['title']) if result['success'] else None
+            entries.append({
+                'index': result['index'],
+                'title': result['title'],
+                'file': indexed[1] if indexed else None,
+                'format': result['format'],
+            })
+        
+        manifest = {
+            'title': playlist_info['title'],
+            'uploader': playlist_info['uploader'],
+            'playlist_dir': str(playlist_dir),
+            'start_index': start_index,
+            'end_index': end_index,
+            'entries': entries,
+        }
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            manifest_file = self.cache_dir / f"{playlist_id}.manifest.json"
+            with open(manifest_file, 'w', encoding='utf-8') as f:
+                f.write(_json_dumps(manifest))
+        except (OSError, TypeError, ValueError) as e:
+            self.logger.warning(f"無法保存下載清單檔: {e}")
+    
     def download_playlist(self, url, start_index=1, end_index=None):
         """
         下載播放清單
@@ -248,6 +587,19 @@ class YouTubePlaylistDownloader:
         print(f"🎵 開始分析播放清單...")
         self.logger.info(f"開始下載播放清單: {url}")
         
+        # 上次已完整下載且檔案都還在時，不需要連線
+        playlist_id = self.extract_playlist_id(url)
+        manifest = self.load_manifest(playlist_id, start_index, end_index)
+        if manifest:
+            self.total_count = len(manifest['entries'])
+            print(f"📋 播放清單: {manifest['title']}")
+            print(f"👤 上傳者: {manifest['uploader']}")
+            print(f"📁 儲存位置: {manifest['playlist_dir']}")
+            print(f"✅ 所有 {self.total_count} 個檔案皆已存在，略過下載")
+            self.logger.info(f"播放清單已完整下載，略過: {manifest['title']} ({self.total_count} 個檔案)")
+            self.show_download_summary(self.total_count)
+            return True
+        
         # 獲取播放清單資訊
         playlist_info = self.get_playlist_info(url)
         if not playlist_info:
@@ -279,68 +631,57 @@ class YouTubePlaylistDownloader:
         playlist_title = self.sanitize_filename(playlist_info['title'])
         playlist_dir = self.output_dir / playlist_title
         playlist_dir.mkdir(parents=True, exist_ok=True)
+        self._dir_index = self.build_dir_index(playlist_dir)
         
-        # 更新輸出路徑
-        self.ydl_opts['outtmpl'] = str(playlist_dir / '%(playlist_index)02d - %(title)s.%(ext)s')
+        # 更新輸出路徑（實際檔名於每個影片下載時設定）
+        self.playlist_dir = playlist_dir
+        self._index_offset = start_index - 1
         
-        # 設定下載範圍
         if end_index:
-            self.ydl_opts['playlist_start'] = start_index
-            self.ydl_opts['playlist_end'] = end_index
             self.logger.info(f"下載範圍: {start_index} - {end_index}")
         elif start_index > 1:
-            self.ydl_opts['playlist_start'] = start_index
             self.logger.info(f"從第 {start_index} 個影片開始下載")
           # 開始下載
         success_count = 0
+        completed = 0
+        results = []
         try:
-            print("🚀 開始下載音頻檔案...")
+            print(f"🚀 開始下載音頻檔案... (並行數: {self.concurrency})")
             
-            # 逐個下載影片以更好地追蹤進度和錯誤
-            for i, entry in enumerate(entries, 1):
-                if not entry:
-                    continue
-                    
-                self.download_count = i
-                self.current_video_info = entry
-                title = entry.get('title', '未知標題')
-                
-                print(f"\n📥 [{i}/{self.total_count}] {title}")
-                
-                # 檢查檔案是否已存在
-                file_exists, existing_file_path, format_used = self.check_file_exists(playlist_dir, i, title)
-                
-                if file_exists:
-                    format_emoji = "🎵" if format_used == 'wav' else "🎶"
-                    print(f"✅ 檔案已存在 ({format_used.upper()}): {existing_file_path}")
-                    self.logger.info(f"檔案已存在 [{i}/{self.total_count}] ({format_used.upper()}): {title}")
-                    success_count += 1
-                    continue  # 跳過下載已存在的檔案
-                
-                # 使用格式回退機制下載
-                output_path = str(playlist_dir / f'{i:02d} - %(title)s.%(ext)s')
-                success, format_used, error_msg = self.download_with_format_fallback(
-                    entry['webpage_url'], output_path, title, i
-                )
-                
-                if success:
-                    success_count += 1
-                    format_emoji = "🎵" if format_used == 'wav' else "🎶"
-                    print(f"{format_emoji} 成功 ({format_used.upper()}): {title}")
-                    self.logger.info(f"成功下載 [{i}/{self.total_count}] ({format_used.upper()}): {title}")
-                else:
-                    self.logger.error(f"下載完全失敗: {title} - {error_msg}")
-                    self.failed_downloads.append({
-                        'index': i,
-                        'title': title,
-                        'url': entry.get('webpage_url', ''),
-                        'error': error_msg,
-                        'timestamp': datetime.now().isoformat()
-                    })
-                    print(f"❌ 跳過: {title}")
-                    continue
+            # 每個影片獨立提交到執行緒池，以重疊網路下載與 FFmpeg 轉換
+            ex = ThreadPoolExecutor(max_workers=self.concurrency)
+            futures = {
+                ex.submit(self._download_one, entry, i, start_index + i - 1): i
+                for i, entry in enumerate(entries, 1) if entry
+            }
+            
+            try:
+                for future in as_completed(futures):
+                    result = future.result()
+                    results.append(result)
+                    with self._lock:
+                        completed += 1
+                        self.download_count = completed
+                        if result['success']:
+                            success_count += 1
+                        else:
+                            self.write_record(self._failed_f, {
+                                'index': result['index'],
+                                'title': result['title'],
+                                'url': result['url'],
+                                'error': result['error'],
+                                'timestamp': datetime.now().isoformat()
+                            })
+            except BaseException:
+                # 中斷（例如 Ctrl+C）時取消尚未開始的下載，不等待執行中的工作
+                for f in futures:
+                    f.cancel()
+                ex.shutdown(wait=False)
+                raise
+            ex.shutdown(wait=True)
             
             self.save_failed_downloads()
+            self.save_manifest(playlist_id, playlist_info, playlist_dir, start_index, end_index, results)
             self.show_download_summary(success_count)
             return True
         except Exception as e:
@@ -349,21 +690,101 @@ class YouTubePlaylistDownloader:
             print(f"❌ {error_msg}")
             return False
     
-    def save_failed_downloads(self):
-        """保存失敗下載的記錄"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    def _download_one(self, entry, i, index):
+        """
+        下載播放清單中的單一項目（於工作執行緒中執行）
+        
+        Args:
+            entry (dict): 播放清單項目資訊
+            i (int): 本次下載中的順序（用於顯示進度）
+            index (int): 影片在播放清單中的索引（用於檔名）
+            
+        Returns:
+            dict: 下載結果 (index, title, url, success, format, error)
+        """
+        title = entry.get('title', '未知標題')
+        video_url = entry.get('webpage_url') or entry.get('url', '')
+        result = {
+            'index': index,
+            'title': title,
+            'url': video_url,
+            'success': False,
+            'format': None,
+            'error': None,
+        }
+        
+        with self._lock:
+            print(f"\n📥 [{i}/{self.total_count}] {title}")
+        
+        try:
+            # 檢查檔案是否已存在
+            file_exists, existing_file_path, format_used = self.check_file_exists(self.playlist_dir, index, title)
+            
+            if file_exists:
+                with self._lock:
+                    print(f"✅ 檔案已存在 ({format_used.upper()}): {existing_file_path}")
+                self.logger.info(f"檔案已存在 [{i}/{self.total_count}] ({format_used.upper()}): {title}")
+                result.update(success=True, format=format_used.lower())
+                return result  # 跳過下載已存在的檔案
+            
+            # 使用格式回退機制下載
+            output_path = str(self.playlist_dir / f'{index:02d} - %(title)s.%(ext)s')
+            success, format_used, error_msg = self.download_with_format_fallback(
+                video_url, output_path, title, index
+            )
+        except Exception as e:
+            success, format_used, error_msg = False, None, str(e)
+        
+        if success:
+            format_emoji = "🎵" if format_used == 'wav' else "🎶"
+            with self._lock:
+                print(f"{format_emoji} 成功 ({format_used.upper()}): {title}")
+            self.logger.info(f"成功下載 [{i}/{self.total_count}] ({format_used.upper()}): {title}")
+            result.update(success=True, format=format_used)
+        else:
+            self.logger.error(f"下載完全失敗: {title} - {error_msg}")
+            with self._lock:
+                print(f"❌ 跳過: {title}")
+            result['error'] = error_msg
+        
+        return result
+    
+    def write_record(self, f, record):
+        """
+        將一筆記錄以 JSONL 格式附加到記錄檔（呼叫端需持有鎖）
+        
+        Args:
+            f (file): 記錄檔
+            record (dict): 記錄內容
+        """
+        f.write(_json_dumps(record) + "\n")
+    
+    def read_records(self, path):
+        """
+        讀取 JSONL 記錄檔
         
-        if self.failed_downloads:
-            failed_log_file = self.output_dir / "logs" / f"failed_downloads_{timestamp}.json"
-            with open(failed_log_file, 'w', encoding='utf-8') as f:
-                json.dump(self.failed_downloads, f, ensure_ascii=False, indent=2)
-            self.logger.info(f"失敗下載記錄已保存至: {failed_log_file}")
+        Args:
+            path (Path): 記錄檔路徑
+            
+        Returns:
+            list: 記錄列表
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return [_json_loads(line) for line in f if line.strip()]
+        except OSError:
+            return []
+    
+    def save_failed_downloads(self):
+        """將緩衝中的失敗與格式嘗試記錄寫入磁碟"""
+        with self._lock:
+            self._failed_f.flush()
+            self._attempts_f.flush()
         
-        if self.format_attempts:
-            format_log_file = self.output_dir / "logs" / f"format_attempts_{timestamp}.json"
-            with open(format_log_file, 'w', encoding='utf-8') as f:
-                json.dump(self.format_attempts, f, ensure_ascii=False, indent=2)
-            self.logger.info(f"格式嘗試記錄已保存至: {format_log_file}")
+        if self._failed_f.tell():
+            self.logger.info(f"失敗下載記錄已保存至: {self._failed_path}")
+        if self._attempts_f.tell():
+            self.logger.info(f"格式嘗試記錄已保存至: {self._attempts_path}")
     
     def show_download_summary(self, success_count):
         """顯示下載摘要"""
@@ -371,9 +792,12 @@ class YouTubePlaylistDownloader:
         print("📊 下載摘要")
         print("=" * 50)
         
+        failed_downloads = self.read_records(self._failed_path)
+        format_attempts = self.read_records(self._attempts_path)
+        
         # 計算格式統計
-        wav_count = len([attempt for attempt in self.format_attempts if attempt.get('format') == 'wav' and 'error' not in attempt])
-        mp3_fallback_count = len([attempt for attempt in self.format_attempts if attempt.get('format') == 'mp3'])
+        wav_count = len([attempt for attempt in format_attempts if attempt.get('format') == 'wav' and 'error' not in attempt])
+        mp3_fallback_count = len([attempt for attempt in format_attempts if attempt.get('format') == 'mp3'])
         
         print(f"✅ 成功: {success_count} 個檔案")
         if wav_count > 0 or mp3_fallback_count > 0:
@@ -381,10 +805,10 @@ class YouTubePlaylistDownloader:
             if mp3_fallback_count > 0:
                 print(f"🎶 MP3 格式 (WAV失敗回退): {mp3_fallback_count} 個")
         
-        if self.failed_downloads:
-            print(f"❌ 失敗: {len(self.failed_downloads)} 個檔案")
+        if failed_downloads:
+            print(f"❌ 失敗: {len(failed_downloads)} 個檔案")
             print("\n失敗清單:")
-            for failed in self.failed_downloads:
+            for failed in failed_downloads:
                 print(f"  {failed['index']:02d}. {failed['title']}")
                 print(f"      💥 {failed['error']}")
             print(f"\n📋 詳細失敗記錄已保存至 logs 資料夾")
@@ -395,11 +819,11 @@ class YouTubePlaylistDownloader:
         print(f"📈 成功率: {success_rate:.1f}%")
         
         # 顯示格式嘗試統計
-        if self.format_attempts:
-            wav_failures = len([a for a in self.format_attempts if a.get('format') == 'wav'])
+        if format_attempts:
+            wav_failures = len([a for a in format_attempts if a.get('format') == 'wav'])
             print(f"⚠️  WAV 轉換失敗: {wav_failures} 個 (已回退到 MP3)")
         
-        self.logger.info(f"下載任務完成 - 成功: {success_count}, 失敗: {len(self.failed_downloads)}, 成功率: {success_rate:.1f}%")
+        self.logger.info(f"下載任務完成 - 成功: {success_count}, 失敗: {len(failed_downloads)}, 成功率: {success_rate:.1f}%")
     
     def download_single_video(self, url):
         """
@@ -413,13 +837,11 @@ class YouTubePlaylistDownloader:
         self.total_count = 1
         self.download_count = 1
         
-        # 為單個影片創建專用設定
-        single_opts = self.ydl_opts.copy()
-        single_opts['outtmpl'] = str(self.output_dir / '%(title)s.%(ext)s')
-        
         try:
-            with yt_dlp.YoutubeDL(single_opts) as ydl:
-                ydl.download([url])
+            # 重複使用 WAV 實例，只覆寫輸出路徑
+            ydl = self.get_ydl('wav')
+            ydl.params['outtmpl'] = {'default': str(self.output_dir / '%(title)s.%(ext)s')}
+            ydl.download([url])
             print("\n✅ 下載完成！")
             self.logger.info("單個影片下載完成")
             return True
@@ -441,16 +863,40 @@ class YouTubePlaylistDownloader:
                 'preferredcodec': 'mp3',
                 'preferredquality': '320',  # 320kbps 高品質
             },
-            {
+        ]
+        if self.write_metadata:
+            mp3_opts['postprocessors'].append({
                 'key': 'FFmpegMetadata',
                 'add_metadata': True,
-            },
-        ]
+            })
         mp3_opts['postprocessor_args'] = {
-            'ffmpeg': ['-threads', '0', '-preset', 'fast']  # 快速轉換
+            'ffmpeg': ['-threads', str(self.ffmpeg_threads), '-preset', 'fast']  # 快速轉換
         }
         return mp3_opts
     
+    def get_ydl(self, audio_format):
+        """
+        取得目前執行緒專用的 YoutubeDL 實例，首次使用時建立
+        
+        Args:
+            audio_format (str): 'wav' 或 'mp3'
+            
+        Returns:
+            yt_dlp.YoutubeDL: 可重複使用的下載器實例
+        """
+        ydl = getattr(self._ydl_local, audio_format, None)
+        if ydl is not None:
+            return ydl
+        
+        # 每個實例持有自己的頂層字典，因為 outtmpl 會在下載時被覆寫
+        opts = dict(self._wav_opts if audio_format == 'wav' else self._mp3_opts)
+        ydl = yt_dlp.YoutubeDL(opts)
+        
+        setattr(self._ydl_local, audio_format, ydl)
+        with self._lock:
+            self._ydl_instances.append(ydl)
+        return ydl
+    
     def download_with_format_fallback(self, video_url, output_path, title, index):
         """
         嘗試使用不同格式下載影片，優先 WAV，失敗時回退到 MP3
@@ -463,17 +909,14 @@ class YouTubePlaylistDownloader:
               Returns:
             tuple: (success, format_used, error_msg)
         """
+        now_iso = datetime.now().isoformat()
+        
         # 首先嘗試 WAV 格式
         try:
-            self.current_format = 'wav'
-            wav_opts = self.ydl_opts.copy()
-            wav_opts['outtmpl'] = output_path
-            # 進一步抑制警告
-            wav_opts['quiet'] = True
-            wav_opts['no_warnings'] = True
-            
-            with yt_dlp.YoutubeDL(wav_opts) as ydl:
-                ydl.download([video_url])
+            self._ydl_local.current_format = 'wav'
+            ydl = self.get_ydl('wav')
+            ydl.params['outtmpl'] = {'default': output_path}
+            ydl.download([video_url])
             
             self.logger.info(f"WAV 格式下載成功: {title}")
             return True, 'wav', None
@@ -483,25 +926,21 @@ class YouTubePlaylistDownloader:
             self.logger.warning(f"WAV 格式失敗，嘗試 MP3: {title} - {wav_error_msg}")
             
             # 記錄 WAV 失敗
-            self.format_attempts.append({
-                'index': index,
-                'title': title,
-                'format': 'wav',
-                'error': wav_error_msg,
-                'timestamp': datetime.now().isoformat()
-            })
+            with self._lock:
+                self.write_record(self._attempts_f, {
+                    'index': index,
+                    'title': title,
+                    'format': 'wav',
+                    'error': wav_error_msg,
+                    'timestamp': now_iso
+                })
             
             # 嘗試 MP3 格式
             try:
-                self.current_format = 'mp3'
-                mp3_opts = self.create_mp3_options()
-                mp3_opts['outtmpl'] = output_path
-                # 進一步抑制警告
-                mp3_opts['quiet'] = True
-                mp3_opts['no_warnings'] = True
-                
-                with yt_dlp.YoutubeDL(mp3_opts) as ydl:
-                    ydl.download([video_url])
+                self._ydl_local.current_format = 'mp3'
+                ydl = self.get_ydl('mp3')
+                ydl.params['outtmpl'] = {'default': output_path}
+                ydl.download([video_url])
                 
                 self.logger.info(f"MP3 格式下載成功: {title}")
                 return True, 'mp3', None
@@ -511,15 +950,98 @@ class YouTubePlaylistDownloader:
                 self.logger.error(f"MP3 格式也失敗: {title} - {mp3_error_msg}")
                 
                 # 記錄 MP3 失敗
-                self.format_attempts.append({
-                    'index': index,
-                    'title': title,
-                    'format': 'mp3',
-                    'error': mp3_error_msg,
-                    'timestamp': datetime.now().isoformat()                })
+                with self._lock:
+                    self.write_record(self._attempts_f, {
+                        'index': index,
+                        'title': title,
+                        'format': 'mp3',
+                        'error': mp3_error_msg,
+                        'timestamp': now_iso
+                    })
                 
                 return False, None, f"WAV: {wav_error_msg}; MP3: {mp3_error_msg}"
     
+    def build_dir_index(self, playlist_dir):
+        """
+        掃描播放清單資料夾一次，建立以影片索引為鍵的檔案快照
+        
+        Args:
+            playlist_dir (Path): 播放清單目錄
+            
+        Returns:
+            dict: {影片索引: [(檔案路徑, 檔名), ...]}，同一索引依格式優先順序排列
+        """
+        possible_formats = ['.wav', '.mp3', '.m4a', '.webm', '.opus']
+        dir_index = {}
+        
+        try:
+            with os.scandir(playlist_dir) as it:
+                for entry in it:
+                    if not entry.is_file():
+                        continue
+                    match = _INDEX_PREFIX_RE.match(entry.name)
+                    ext = os.path.splitext(entry.name)[1].lower()
+                    if not match or ext not in possible_formats:
+                        continue
+                    dir_index.setdefault(int(match.group(1)), []).append((Path(entry.path), entry.name))
+        except OSError as e:
+            self.logger.warning(f"無法掃描播放清單資料夾: {e}")
+        
+        for files in dir_index.values():
+            files.sort(key=lambda f: possible_formats.index(os.path.splitext(f[1])[1].lower()))
+        return dir_index
+    
+    def title_matches(self, file_stem, index, title):
+        """
+        檢查檔名（不含副檔名）是否對應指定的影片標題
+        
+        Args:
+            file_stem (str): 檔名（不含副檔名）
+            index (int): 影片索引
+            title (str): 影片標題
+            
+        Returns:
+            bool: 是否為同一影片
+        """
+        clean_title = self.sanitize_filename(title)
+        
+        # 精確匹配
+        if file_stem in (f"{index:02d} - {clean_title}", f"{index:02d} - {title}"):
+            return True
+        
+        # yt-dlp 會把不合法字元換成全形字元，比對時將標點符號與底線都視為分隔
+        match = _INDEX_PREFIX_RE.match(file_stem)
+        stem_title = file_stem[match.end():] if match else file_stem
+        stem_words = _NONWORD_RE.sub(' ', stem_title.lower()).split()
+        title_words = _NONWORD_RE.sub(' ', title.lower()).split()
+        if title_words and stem_words == title_words:
+            return True
+        
+        # 提取標題的主要關鍵字，過濾掉太短的關鍵字
+        significant_keywords = [kw for kw in title_words if len(kw) > 2]
+        if significant_keywords:
+            stem_lower = stem_title.lower()
+            matches = sum(1 for kw in significant_keywords if kw in stem_lower)
+            return matches >= len(significant_keywords) * 0.7  # 至少70%匹配
+        return False
+    
+    def match_indexed_file(self, dir_index, index, title):
+        """
+        從資料夾快照中找出索引與標題都相符的檔案
+        
+        Args:
+            dir_index (dict): build_dir_index 的結果
+            index (int): 影片索引
+            title (str): 影片標題
+            
+        Returns:
+            tuple: (檔案路徑, 檔名)，找不到則返回 None
+        """
+        for file_path, name in dir_index.get(index, ()):
+            if self.title_matches(os.path.splitext(name)[0], index, title):
+                return file_path, name
+        return None
+    
     def check_file_exists(self, playlist_dir, index, title):
         """
         檢查檔案是否已經存在
@@ -532,10 +1054,20 @@ class YouTubePlaylistDownloader:
         Returns:
             tuple: (exists, existing_file_path, format)
         """
+        # 優先查詢資料夾快照；索引可能因播放清單重新排序而對應到其他影片，因此仍需比對標題
+        if self._dir_index is not None and playlist_dir == self.playlist_dir:
+            indexed = self.match_indexed_file(self._dir_index, index, title)
+            if indexed:
+                file_path, name = indexed
+                format_name = os.path.splitext(name)[1][1:].upper()
+                return True, file_path, format_name
+            # 快照已涵蓋所有「索引 - 標題.副檔名」的檔案，不需再逐一 stat
+            return False, None, None
+        
         # 清理標題用於檔名比較
         clean_title = self.sanitize_filename(title)
         
-        # 可能的檔案格式
+        # 可能的檔案格式（最常見的 .wav 放在最前面）
         possible_formats = ['.wav', '.mp3', '.m4a', '.webm', '.opus']
         
         # 精確匹配：優先檢查帶索引的檔名
@@ -548,35 +1080,10 @@ class YouTubePlaylistDownloader:
         for pattern in exact_patterns:
             for ext in possible_formats:
                 file_path = playlist_dir / f"{pattern}{ext}"
-                if file_path.exists():
+                if os.path.isfile(file_path):
                     format_name = ext[1:].upper()  # 移除點並轉大寫
                     return True, file_path, format_name
         
-        # 如果精確匹配失敗，嘗試模糊匹配（但更嚴格）
-        try:
-            # 只檢查以當前索引開頭的檔案
-            index_prefix = f"{index:02d} -"
-            
-            for file_path in playlist_dir.glob(f"{index_prefix}*"):
-                if file_path.is_file():
-                    # 檢查檔名是否包含標題的關鍵字
-                    file_stem = file_path.stem.lower()
-                    title_lower = clean_title.lower()
-                    
-                    # 提取標題的主要關鍵字（去除特殊字元）
-                    title_keywords = re.sub(r'[^\w\s]', '', title_lower).split()
-                    # 過濾掉太短的關鍵字
-                    significant_keywords = [kw for kw in title_keywords if len(kw) > 2]
-                    
-                    # 如果有足夠的關鍵字，並且檔名包含大部分關鍵字
-                    if significant_keywords:
-                        matches = sum(1 for kw in significant_keywords if kw in file_stem)
-                        if matches >= len(significant_keywords) * 0.7:  # 至少70%匹配
-                            format_name = file_path.suffix[1:].upper() if file_path.suffix else "UNKNOWN"
-                            return True, file_path, format_name
-        except Exception:
-            pass
-        
         return False, None, None
 
 def main():
@@ -631,6 +1138,7 @@ def main():
     else:
         print("\n💥 下載任務失敗，請檢查 URL 是否正確或網路連線")
     
+    downloader.close()
     input("\n按 Enter 鍵退出...")
 
 if __name__ == "__main__":